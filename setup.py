@@ -21,6 +21,9 @@ setup(
     url='https://github.com/bnbalsamo/solenc',
     install_requires=[
     ],
+    extras_require={
+        'numpy': ['numpy']
+    },
     tests_require=[
         'pytest'
     ],
@@ -1,13 +1,28 @@
 """
 solenc
 """
+import struct
 from random import shuffle as _shuffle
 from random import SystemRandom
+from random import random as _random
+from itertools import islice
 import string
 from json import dumps, loads
 import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import dis
+import hashlib
 import logging
-from sys import stdout
+import os
+import signal
+import tempfile
+import tracemalloc
+from sys import stdout, stderr
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
 
 
 __author__ = "Brian Balsamo"
@@ -72,6 +87,10 @@ offsets = {
 }
 
 
+# Leads the compact binary deck serialization, see Deck.to_bytes
+_DECK_BYTES_MAGIC = b"SOLENC\x01"
+
+
 def to_number(c):
     """
     Convert letter to number: Aa->1, Bb->2, ..., Zz->26.
@@ -90,10 +109,107 @@ def to_character(n):
     return chr((n - 1) % 26 + 65)
 
 
+# Byte tables for working on whole buffers at once with bytes.translate,
+# the batch counterparts of to_number and to_character
+_LETTER_VALUES = bytes(to_number(chr(c)) for c in range(256))
+_VALUE_LETTERS = bytes(ord(to_character(v)) for v in range(256))
+# For adding lanes which can't carry into each other, see _mix_values
+_LANE_NEGATE = bytes((128 - v) % 256 for v in range(256))
+_LANE_FOLD_ADD = bytes((s - 1) % 26 + 1 for s in range(256))
+_LANE_FOLD_SUBTRACT = bytes((s - 128 - 1) % 26 + 1 for s in range(256))
+
+
+def letters_to_values(text):
+    """
+    Convert a whole str or bytes of letters to a bytes of numbers,
+    as to_number does for a single character
+    """
+    if isinstance(text, str):
+        # Anything non-ASCII becomes a "?", which becomes an X
+        text = text.encode("ascii", "replace")
+    return bytes(text).translate(_LETTER_VALUES)
+
+
+def values_to_letters(values):
+    """
+    Convert a whole sequence of numbers to a str of letters,
+    as to_character does for a single number
+    """
+    return _as_value_bytes(values).translate(_VALUE_LETTERS).decode("ascii")
+
+
+def _as_value_bytes(values):
+    if isinstance(values, bytes):
+        return values
+    if _np is not None and isinstance(values, _np.ndarray):
+        # Check before narrowing to bytes, which would wrap out of range values
+        if values.size and (values.min() < 0 or values.max() > 127):
+            raise ValueError("Values must be from 0 to 127")
+        return values.astype(_np.uint8).tobytes()
+    return bytes(values)
+
+
+def _mix_values(a, b, sign):
+    if len(a) != len(b):
+        raise ValueError("Value sequences must be the same length")
+    a = _as_value_bytes(a)
+    b = _as_value_bytes(b)
+    if max(a, default=0) > 127 or max(b, default=0) > 127:
+        raise ValueError("Values must be from 0 to 127")
+    if _np is not None:
+        a = _np.frombuffer(a, dtype=_np.uint8).astype(_np.int16)
+        b = _np.frombuffer(b, dtype=_np.uint8).astype(_np.int16)
+        return ((a + sign * b - 1) % 26 + 1).astype(_np.uint8).tobytes()
+    # Treat each buffer as one big integer with a byte per lane. Lanes
+    # are below 128, so adding the integers adds every lane at once
+    # without carries, and a translate folds the sums back into 1-26.
+    if sign > 0:
+        fold = _LANE_FOLD_ADD
+    else:
+        b = b.translate(_LANE_NEGATE)
+        fold = _LANE_FOLD_SUBTRACT
+    lanes = int.from_bytes(a, "big") + int.from_bytes(b, "big")
+    return lanes.to_bytes(len(a), "big").translate(fold)
+
+
+def add_values(a, b):
+    """
+    Add two equal length sequences of numbers, returning the sums
+    mod 26 as a bytes of numbers from 1 to 26
+
+    Values must be from 0 to 127. Uses NumPy if it's available.
+    """
+    return _mix_values(a, b, 1)
+
+
+def subtract_values(a, b):
+    """
+    Subtract one equal length sequence of numbers from another,
+    returning the differences mod 26 as a bytes of numbers from 1 to 26
+
+    Values must be from 0 to 127. Uses NumPy if it's available.
+    """
+    return _mix_values(a, b, -1)
+
+
 def to_deck_value(c):
     return offsets[c.get_suite()] + c.get_value()
 
 
+def from_deck_value(v):
+    """
+    Convert a deck value back into a card: 1->Ace of Clubs, ...,
+    52->King of Spades, 53->Joker (A), 54->Joker (B)
+    """
+    if v == 53:
+        return Joker("A")
+    if v == 54:
+        return Joker("B")
+    if v not in range(1, 53):
+        raise ValueError("Not a recognized deck value")
+    return Card(suites[(v - 1) // 13], (v - 1) % 13 + 1)
+
+
 class Card:
     """
     A class for representing a playing card
@@ -112,8 +228,9 @@ class Card:
         return Card(suite, value)
 
     def __eq__(self, other):
-        if self.get_suite() == other.get_suite() and \
-                self.get_value() == other.get_value():
+        # Compared against every card while searching a deck,
+        # so this skips the accessors
+        if self._suite == other._suite and self._value == other._value:
             return True
         return False
 
@@ -185,6 +302,39 @@ class Joker(Card):
         self._value = value
 
 
+# Shared Jokers for finding the real ones in a deck by equality
+_JOKER_A = Joker("A")
+_JOKER_B = Joker("B")
+
+
+def _reverse(cards, i, j):
+    """
+    Reverse cards[i:j] in place, without building any intermediate lists
+    """
+    j -= 1
+    while i < j:
+        cards[i], cards[j] = cards[j], cards[i]
+        i += 1
+        j -= 1
+
+
+def _respace(letters, message):
+    """
+    Put the spaces in message back into letters, message with its spaces removed
+    """
+    groups = []
+    i = 0
+    start = 0
+    while True:
+        end = message.find(" ", start)
+        if end < 0:
+            groups.append(letters[i:])
+            return " ".join(groups)
+        groups.append(letters[i:i + end - start])
+        i += end - start
+        start = end + 1
+
+
 class Deck:
     """
     Container object for cards and algorithm step implementations
@@ -201,6 +351,21 @@ class Deck:
                 cards.append(Card.loads(x))
         return Deck(cards=cards, shuffle=shuffle)
 
+    @classmethod
+    def from_bytes(cls, b, shuffle=False):
+        """
+        Load a deck from the compact form produced by Deck.to_bytes
+        """
+        if not b.startswith(_DECK_BYTES_MAGIC):
+            raise ValueError("Not a deck serialization")
+        values = b[len(_DECK_BYTES_MAGIC):]
+        if sorted(values) != list(range(1, 55)):
+            raise ValueError("Not a complete deck with both Jokers")
+        return Deck(
+            cards=[from_deck_value(v) for v in values],
+            shuffle=shuffle
+        )
+
     @classmethod
     def from_json_str(cls, json, shuffle=False):
         cards_list = loads(json)
@@ -227,6 +392,7 @@ class Deck:
 
     def __init__(self, shuffle=True, jokers=True, cards=None):
         self._cards = []
+        self._tracer = None
 
         if cards is None:
             for suite in suites:
@@ -246,6 +412,15 @@ class Deck:
     def get_cards(self):
         return self._cards
 
+    def get_tracer(self):
+        return self._tracer
+
+    def set_tracer(self, tracer):
+        """
+        Record every step taken with this deck to a StepTracer, or stop with None
+        """
+        self._tracer = tracer
+
     def set_cards(self, cards):
         for x in cards:
             self.add_card(x)
@@ -281,32 +456,101 @@ class Deck:
         with open(fp, 'w') as f:
             f.write(self.to_newline_delimited_str())
 
-    def triple_cut(self):
-        joker_indices = []
-        for i, x in enumerate(self._cards):
+    def to_bytes(self):
+        """
+        Serialize the deck compactly, one byte per card holding its deck
+        value, with Joker (A) as 53 and Joker (B) as 54
+        """
+        values = []
+        for x in self.get_cards():
             if isinstance(x, Joker):
-                joker_indices.append(i)
-        self._cards[:] = self._cards[joker_indices[1] + 1:] + \
-            self._cards[joker_indices[0]:joker_indices[1] + 1] + \
-            self._cards[0:joker_indices[0]]
+                joker = str(x.get_value()).upper()
+                if joker not in ("A", "B"):
+                    raise ValueError("Only Jokers A and B can be serialized")
+                values.append(53 if joker == "A" else 54)
+            else:
+                values.append(to_deck_value(x))
+        return _DECK_BYTES_MAGIC + bytes(values)
+
+    # The cuts rearrange the cards in place by reversing runs of them,
+    # rather than slicing and concatenating, so that generating the
+    # keystream doesn't allocate anything per card.
+    #
+    # The steps are split into untraced versions which report what they
+    # did, and public versions which record that to the tracer. A whole
+    # round of the algorithm is traced as a single record instead.
+
+    def _triple_cut(self):
+        cards = self._cards
+        first = -1
+        i = 0
+        while True:
+            if isinstance(cards[i], Joker):
+                if first >= 0:
+                    break
+                first = i
+            i += 1
+        n = len(cards)
+        # [top][jokers][bottom] -> [bottom][jokers][top]
+        _reverse(cards, 0, n)
+        _reverse(cards, 0, n - i - 1)
+        _reverse(cards, n - i - 1, n - first)
+        _reverse(cards, n - first, n)
+        return first, i
 
-    def count_cut(self, cut_at=None):
+    def triple_cut(self):
+        first, second = self._triple_cut()
+        if self._tracer is not None:
+            self._tracer.record(TRACE_TRIPLE_CUT, first, second)
+
+    def _count_cut(self, cut_at=None):
+        cards = self._cards
         if cut_at is None:
-            bottom_card = self._cards[-1]
+            bottom_card = cards[-1]
             if isinstance(bottom_card, Joker):
-                return
+                return 0
             cut_at = to_deck_value(bottom_card)
-        self._cards[:-1] = self._cards[cut_at:-1] + self._cards[:cut_at]
+        n = len(cards) - 1
+        if cut_at > n:
+            cut_at = n
+        # [top][rest][bottom card] -> [rest][top][bottom card]
+        _reverse(cards, 0, cut_at)
+        _reverse(cards, cut_at, n)
+        _reverse(cards, 0, n)
+        return cut_at
 
-    def move_down_1(self, card):
+    def count_cut(self, cut_at=None):
+        keying = cut_at is not None
+        cut_at = self._count_cut(cut_at)
+        if self._tracer is not None:
+            self._tracer.record(
+                TRACE_COUNT_CUT, cut_at, _trace_value(self._cards[-1]), int(keying)
+            )
+
+    def _move_down_1(self, card):
         # If it's the last card move it to the front
         if self._cards[-1] == card:
             x = self._cards.pop()
             self._cards.insert(0, x)
+            wrapped = True
+        else:
+            wrapped = False
         n = self._cards.index(card)
         self._cards[n], self._cards[n + 1] = self._cards[n + 1], self._cards[n]
+        if wrapped:
+            return len(self._cards) - 1
+        return n
 
-    def get_keynum(self):
+    def move_down_1(self, card):
+        n = self._move_down_1(card)
+        if self._tracer is not None:
+            self._tracer.record(
+                TRACE_MOVE_DOWN_1, _trace_value(card), n, len(self._cards)
+            )
+
+    def _get_keynum(self):
+        # As get_keynum, but returns None for a Joker rather than raising,
+        # since an exception is an allocation on the keystream's hot path
         top_card = self._cards[0]
         if isinstance(top_card, Joker):
             topcard_value = 53
@@ -314,73 +558,738 @@ class Deck:
             topcard_value = to_deck_value(top_card)
         selected_card = self._cards[topcard_value]
         if isinstance(selected_card, Joker):
+            return None
+        return to_deck_value(selected_card)
+
+    def get_keynum(self):
+        selected_card_value = self._get_keynum()
+        if self._tracer is not None:
+            top_card_value = _trace_value(self._cards[0])
+            self._tracer.record(
+                TRACE_KEYNUM, top_card_value,
+                _trace_value(self._cards[min(top_card_value, 53)]),
+                selected_card_value or 0
+            )
+        if selected_card_value is None:
             raise ValueError("Selected a Joker")
-        else:
-            selected_card_value = to_deck_value(selected_card)
         return selected_card_value
 
     def gen_keystream(self, l):
         keystream = []
-        a_joker = Joker("A")
-        b_joker = Joker("B")
+        a_joker = _JOKER_A
+        b_joker = _JOKER_B
+        tracer = self._tracer
         i = 0
         while i < l:
-            self.move_down_1(a_joker)
-            self.move_down_1(b_joker)
-            self.move_down_1(b_joker)
-            self.triple_cut()
-            self.count_cut()
-            try:
-                keynum = self.get_keynum()
-            except ValueError:  # It's a Joker, skip this round and repeat
+            a_from = self._move_down_1(a_joker)
+            b_from = self._move_down_1(b_joker)
+            b_from_2 = self._move_down_1(b_joker)
+            first, second = self._triple_cut()
+            cut_at = self._count_cut()
+            keynum = self._get_keynum()
+            if tracer is not None:
+                tracer.record(
+                    TRACE_ROUND, a_from, b_from, b_from_2, first, second, cut_at,
+                    _trace_value(self._cards[0]), keynum or 0, len(self._cards)
+                )
+            if keynum is None:  # It's a Joker, skip this round and repeat
                 continue
             keystream.append(keynum)
             i += 1
         return keystream
 
     def key(self, passphrase):
-        a_joker = Joker("A")
-        b_joker = Joker("B")
+        a_joker = _JOKER_A
+        b_joker = _JOKER_B
+        tracer = self._tracer
         for char in passphrase:
             char_num = to_number(char)
-            self.move_down_1(a_joker)
-            self.move_down_1(b_joker)
-            self.move_down_1(b_joker)
-            self.triple_cut()
-            self.count_cut()
-            self.count_cut(char_num)
+            a_from = self._move_down_1(a_joker)
+            b_from = self._move_down_1(b_joker)
+            b_from_2 = self._move_down_1(b_joker)
+            first, second = self._triple_cut()
+            cut_at = self._count_cut()
+            key_cut_at = self._count_cut(char_num)
+            if tracer is not None:
+                tracer.record(
+                    TRACE_KEY_ROUND, a_from, b_from, b_from_2, first, second, cut_at,
+                    key_cut_at, 0, len(self._cards)
+                )
 
     def encrypt(self, message):
-        encrypted_str = ""
+        # Leave spaces intact, it's up to the caller
+        # to properly format the string to not leak
+        # information via character groupings.
+        # See format_str below for an example
+        letters = message.replace(" ", "")
+        keystream = bytes(self.gen_keystream(len(letters)))
+        encrypted = add_values(letters_to_values(letters), keystream)
+        return _respace(values_to_letters(encrypted), message)
+
+    def decrypt(self, message):
+        letters = message.replace(" ", "")
+        keystream = bytes(self.gen_keystream(len(letters)))
+        decrypted = subtract_values(letters_to_values(letters), keystream)
+        return _respace(values_to_letters(decrypted), message)
+
+    cards = property(get_cards, set_cards, del_cards)
+    tracer = property(get_tracer, set_tracer)
+
+
+def _trace_value(card):
+    # Deck values for the tracer, which records numbers rather than cards
+    if isinstance(card, Joker):
+        return 53 if card._value in ("A", "a") else 54
+    return offsets[card._suite] + card._value
+
+
+# The kinds of record kept by StepTracer
+TRACE_MOVE_DOWN_1 = 1
+TRACE_TRIPLE_CUT = 2
+TRACE_COUNT_CUT = 3
+TRACE_KEYNUM = 4
+TRACE_ROUND = 5
+TRACE_KEY_ROUND = 6
+
+# A StepTracer record, a kind and up to nine integers
+_TRACE_RECORD = struct.Struct("=b9h")
+
+
+class StepTracer:
+    """
+    Records the steps taken with a Deck, to write out as a worksheet for
+    checking against a physical deck. Attach one with Deck.set_tracer.
+
+    Steps are packed into fixed size records in a ring buffer holding
+    the most recent capacity records, and nothing is formatted
+    until to_worksheet is called, so it's cheap to leave on. Records
+    are (kind, ...), padded with zeros, where kind is one of:
+
+    - TRACE_MOVE_DOWN_1: card, from position, deck size
+    - TRACE_TRIPLE_CUT: first Joker position, second Joker position
+    - TRACE_COUNT_CUT: cards cut, bottom card, 1 if keying else 0
+    - TRACE_KEYNUM: top card, selected card, output
+    - TRACE_ROUND: a whole round of gen_keystream, as the positions the
+      A Joker and then the B Joker twice moved from, the Joker positions
+      for the triple cut, cards count cut, top card, output and deck size
+    - TRACE_KEY_ROUND: a whole round of Deck.key, as TRACE_ROUND but
+      with the cards count cut for the key in place of the top card,
+      and no output
+
+    Positions count from 0 and cards are deck values, with the Jokers
+    as 53 and 54. No cards cut or an output of 0 mean a Joker stopped
+    the step.
+    """
+
+    def __init__(self, capacity=16384):
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self._capacity = capacity
+        self._records = bytearray(capacity * _TRACE_RECORD.size)
+        self._pack_into = _TRACE_RECORD.pack_into
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self._capacity)
+
+    def get_capacity(self):
+        return self._capacity
+
+    def get_count(self):
+        """
+        The number of records made, including those since overwritten
+        """
+        return self._count
+
+    def record(self, kind, a=0, b=0, c=0, d=0, e=0, f=0, g=0, h=0, i=0):
+        n = self._next
+        self._pack_into(self._records, n, kind, a, b, c, d, e, f, g, h, i)
+        n += _TRACE_RECORD.size
+        self._next = 0 if n == len(self._records) else n
+        self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def get_records(self):
+        """
+        The records as tuples, oldest first
+        """
+        records = list(_TRACE_RECORD.iter_unpack(self._records))
+        if self._count < self._capacity:
+            return records[:self._count]
+        n = self._next // _TRACE_RECORD.size
+        return records[n:] + records[:n]
+
+    def to_worksheet(self):
+        """
+        Render the records as numbered steps, with positions counting from 1
+        """
+        lines = []
+        step = self._count - len(self)
+        if step:
+            lines.append("({} earlier steps not kept)".format(step))
+        for kind, a, b, c, d, e, f, g, h, i in self.get_records():
+            step += 1
+            if kind == TRACE_MOVE_DOWN_1:
+                line = _worksheet_move(from_deck_value(a), b, c)
+            elif kind == TRACE_TRIPLE_CUT:
+                line = _worksheet_triple_cut(a, b)
+            elif kind == TRACE_COUNT_CUT:
+                line = _worksheet_count_cut(a, from_deck_value(b), c)
+            elif kind == TRACE_KEYNUM:
+                line = _worksheet_keynum(from_deck_value(a), from_deck_value(b), c)
+            else:
+                if kind == TRACE_KEY_ROUND:
+                    lines.append("Step {}: Keying round".format(step))
+                    last = _worksheet_count_cut(g, None, 1)
+                else:
+                    lines.append("Step {}: Keystream round".format(step))
+                    last = _worksheet_keynum(from_deck_value(g), None, h)
+                for line in (
+                    _worksheet_move(Joker("A"), a, i),
+                    _worksheet_move(Joker("B"), b, i),
+                    _worksheet_move(Joker("B"), c, i),
+                    _worksheet_triple_cut(d, e),
+                    _worksheet_count_cut(f, None, 0),
+                    last
+                ):
+                    lines.append("  - " + line)
+                continue
+            lines.append("Step {}: {}".format(step, line))
+        return "\n".join(lines)
+
+    def dump(self, f):
+        """
+        Write the worksheet to a file object
+        """
+        f.write(self.to_worksheet() + "\n")
+        f.flush()
+
+    capacity = property(get_capacity)
+    count = property(get_count)
+    records = property(get_records)
+
+
+def _worksheet_move(card, n, deck_size):
+    to = 1 if n == deck_size - 1 else n + 1
+    return "Move {} down from position {} to {}".format(card, n + 1, to + 1)
+
+
+def _worksheet_triple_cut(first, second):
+    return "Triple cut around the Jokers at positions {} and {}".format(
+        first + 1, second + 1
+    )
+
+
+def _worksheet_cards(n):
+    return "{} card{}".format(n, "" if n == 1 else "s")
+
+
+def _worksheet_count_cut(cut_at, bottom_card, keying):
+    if keying:
+        return "Count cut {} for the key".format(_worksheet_cards(cut_at))
+    if not cut_at:
+        return "No count cut, a Joker is on the bottom"
+    if bottom_card is None:
+        return "Count cut {}".format(_worksheet_cards(cut_at))
+    return "Count cut {} for the {} on the bottom".format(
+        _worksheet_cards(cut_at), bottom_card
+    )
+
+
+def _worksheet_keynum(top_card, selected_card, keynum):
+    line = "Count down {} for the {} on top".format(
+        _worksheet_cards(min(_trace_value(top_card), 53)), top_card
+    )
+    if selected_card is not None:
+        line += " to the {}".format(selected_card)
+    if not keynum:
+        return line + ", a Joker, no output"
+    return line + ", output {} ({})".format(keynum, to_character(keynum))
+
+
+class _TreapNode:
+    """
+    A node of an implicit treap
+
+    Nodes carry no key, a node's position in the sequence is the
+    number of nodes to its left.
+    """
+
+    __slots__ = ("value", "priority", "size", "left", "right", "parent")
+
+    def __init__(self, value):
+        self.value = value
+        self.priority = _random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+def _treap_pull(t):
+    """
+    Recompute a node's subtree size and point its children back at it
+    """
+    size = 1
+    if t.left is not None:
+        size += t.left.size
+        t.left.parent = t
+    if t.right is not None:
+        size += t.right.size
+        t.right.parent = t
+    t.size = size
+
+
+def _treap_split(t, k):
+    """
+    Split a treap into a treap of its first k nodes and a treap of the rest
+
+    The parent pointers of the returned roots are left for the caller to reset.
+    """
+    if t is None:
+        return None, None
+    left_size = t.left.size if t.left is not None else 0
+    if k <= left_size:
+        a, b = _treap_split(t.left, k)
+        t.left = b
+        _treap_pull(t)
+        return a, t
+    a, b = _treap_split(t.right, k - left_size - 1)
+    t.right = a
+    _treap_pull(t)
+    return t, b
+
+
+def _treap_merge(a, b):
+    """
+    Concatenate two treaps
+
+    The parent pointer of the returned root is left for the caller to reset.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _treap_merge(a.right, b)
+        _treap_pull(a)
+        return a
+    b.left = _treap_merge(a, b.left)
+    _treap_pull(b)
+    return b
+
+
+def _treap_build(values, nodes):
+    """
+    Build a treap holding values in order in O(n), recording
+    the node for each value in nodes
+    """
+    stack = []
+    for v in values:
+        node = _TreapNode(v)
+        nodes[v] = node
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    if not stack:
+        return None
+    root = stack[0]
+    # Children always land after their parents here, so walking
+    # this backwards fills in sizes from the leaves up.
+    order = []
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        order.append(node)
+        if node.left is not None:
+            todo.append(node.left)
+        if node.right is not None:
+            todo.append(node.right)
+    for node in reversed(order):
+        _treap_pull(node)
+    return root
+
+
+class GeneralizedDeck:
+    """
+    A Solitaire deck of any number of cards, mixing into any alphabet
+
+    Cards are the integers 1 through size, the two largest being the
+    A and B Jokers. With the defaults (54 cards and a 26 letter
+    alphabet) this produces exactly the same keystream as Deck.
+    As with Deck, symbols outside a str alphabet containing X are
+    treated as X's; otherwise they raise a ValueError.
+
+    The cards are held in an implicit treap, so moving a Joker, the
+    triple cut and the count cut each cost O(log n) in the deck size.
+    The alphabet may be a str, or a bytes object to encrypt bytes.
+    """
+
+    def __init__(self, size=54, alphabet=string.ascii_uppercase,
+                 cards=None, shuffle=False):
+        if size < 3:
+            raise ValueError("A deck needs at least one card and two Jokers")
+        self._size = size
+        self._alphabet = None
+        self._index = None
+        self._passthrough = None
+        self._unknown = None
+        self._root = None
+        self._nodes = [None] * (size + 1)
+
+        self.set_alphabet(alphabet)
+        if cards is None:
+            cards = range(1, size + 1)
+        else:
+            cards = list(cards)
+            if sorted(cards) != list(range(1, size + 1)):
+                raise ValueError(
+                    "Cards must be an ordering of 1 through {}".format(size)
+                )
+        if shuffle:
+            cards = list(cards)
+            SystemRandom().shuffle(cards)
+        self._root = _treap_build(cards, self._nodes)
+
+    @classmethod
+    def from_deck(cls, deck, alphabet=string.ascii_uppercase):
+        """
+        Build the GeneralizedDeck equivalent to a standard 54 card Deck
+        """
+        values = []
+        for card in deck.cards:
+            if isinstance(card, Joker):
+                values.append(53 if str(card.get_value()).upper() == "A" else 54)
+            else:
+                values.append(to_deck_value(card))
+        return cls(size=len(values), alphabet=alphabet, cards=values)
+
+    def __eq__(self, other):
+        return self.get_alphabet() == other.get_alphabet() and \
+            self.to_list() == other.to_list()
+
+    def __len__(self):
+        return self._size
+
+    def get_size(self):
+        return self._size
+
+    def get_alphabet(self):
+        return self._alphabet
+
+    def set_alphabet(self, alphabet):
+        if len(alphabet) < 2:
+            raise ValueError("An alphabet needs at least two symbols")
+        index = {}
+        for i, c in enumerate(alphabet):
+            if c in index:
+                raise ValueError("Alphabet symbols must be unique")
+            index[c] = i
+        if isinstance(alphabet, str):
+            # Match letters case-insensitively unless the
+            # alphabet itself tells the cases apart
+            for i, c in enumerate(alphabet):
+                index.setdefault(c.lower(), i)
+                index.setdefault(c.upper(), i)
+            space = " "
+            unknown = index.get("X")
+        else:
+            space = ord(" ")
+            unknown = None
+        self._alphabet = alphabet
+        self._index = index
+        self._passthrough = None if space in index else space
+        self._unknown = unknown
+
+    def get_a_joker(self):
+        return self._size - 1
+
+    def get_b_joker(self):
+        return self._size
+
+    def to_list(self):
+        values = []
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            values.append(node.value)
+            node = node.right
+        return values
+
+    def _set_root(self, root):
+        root.parent = None
+        self._root = root
+
+    def _position(self, node):
+        pos = node.left.size if node.left is not None else 0
+        while node.parent is not None:
+            parent = node.parent
+            if parent.right is node:
+                pos += 1 + (parent.left.size if parent.left is not None else 0)
+            node = parent
+        return pos
+
+    def _node_at(self, i):
+        node = self._root
+        while True:
+            left_size = node.left.size if node.left is not None else 0
+            if i < left_size:
+                node = node.left
+            elif i == left_size:
+                return node
+            else:
+                i -= left_size + 1
+                node = node.right
+
+    def _char_value(self, char):
+        try:
+            return self._index[char]
+        except KeyError:
+            if self._unknown is not None:
+                return self._unknown
+            raise ValueError("{!r} is not in the alphabet".format(char))
+
+    def triple_cut(self):
+        a = self._position(self._nodes[self._size - 1])
+        b = self._position(self._nodes[self._size])
+        top, bottom = (a, b) if a < b else (b, a)
+        rest, lower = _treap_split(self._root, bottom + 1)
+        upper, middle = _treap_split(rest, top)
+        self._set_root(_treap_merge(_treap_merge(lower, middle), upper))
+
+    def count_cut(self, cut_at=None):
+        """
+        Count cut the deck, by the bottom card's value if cut_at is omitted
+
+        cut_at is reduced modulo the number of cards above the bottom card,
+        so alphabets larger than the deck may still be used for keying.
+        """
+        if cut_at is None:
+            node = self._root
+            while node.right is not None:
+                node = node.right
+            cut_at = node.value
+            if cut_at >= self._size - 1:
+                return
+        cut_at %= self._size - 1
+        rest, bottom = _treap_split(self._root, self._size - 1)
+        upper, lower = _treap_split(rest, cut_at)
+        self._set_root(_treap_merge(_treap_merge(lower, upper), bottom))
+
+    def move_down_1(self, card):
+        node = self._nodes[card]
+        n = self._position(node)
+        if n == self._size - 1:
+            # The bottom card wraps around to just below the top card
+            rest, node = _treap_split(self._root, n)
+            top, rest = _treap_split(rest, 1)
+            self._set_root(_treap_merge(_treap_merge(top, node), rest))
+            return
+        # Swapping neighbours leaves the shape of the treap alone,
+        # so swap the values and repoint the nodes instead
+        other = self._node_at(n + 1)
+        node.value, other.value = other.value, node.value
+        self._nodes[node.value] = node
+        self._nodes[other.value] = other
+
+    def get_keynum(self):
+        node = self._root
+        while node.left is not None:
+            node = node.left
+        # Both Jokers count as the A Joker's value
+        topcard_value = min(node.value, self._size - 1)
+        selected_card_value = self._node_at(topcard_value).value
+        if selected_card_value >= self._size - 1:
+            raise ValueError("Selected a Joker")
+        return selected_card_value
+
+    def _step(self):
+        self.move_down_1(self._size - 1)
+        self.move_down_1(self._size)
+        self.move_down_1(self._size)
+        self.triple_cut()
+        self.count_cut()
+
+    def gen_keystream(self, l):
+        keystream = []
+        while len(keystream) < l:
+            self._step()
+            try:
+                keystream.append(self.get_keynum())
+            except ValueError:  # It's a Joker, skip this round and repeat
+                continue
+        return keystream
+
+    def key(self, passphrase):
+        for char in passphrase:
+            char_num = self._char_value(char) + 1
+            self._step()
+            self.count_cut(char_num)
+
+    def _mix(self, message, sign):
+        alphabet = self._alphabet
+        modulus = len(alphabet)
+        passthrough = self._passthrough
+        keystream = iter(self.gen_keystream(
+            sum(1 for char in message if char != passthrough)
+        ))
+        out = []
         for char in message:
-            # Leave spaces intact, it's up to the caller
-            # to properly format the string to not leak
-            # information via character groupings.
-            # See format_str below for an example
-            if char == " ":
-                encrypted_str = encrypted_str + " "
+            # As with Deck, spaces are left for the caller to deal with
+            if char == passthrough:
+                out.append(char)
                 continue
-            keynum = self.gen_keystream(1)[0]
-            cleartext_charnum = to_number(char)
-            cipher_num = keynum + cleartext_charnum
-            cipher_char = to_character(cipher_num)
-            encrypted_str = encrypted_str + cipher_char
-        return encrypted_str
+            i = self._char_value(char) + sign * next(keystream)
+            out.append(alphabet[i % modulus])
+        if isinstance(alphabet, str):
+            return "".join(out)
+        return bytes(out)
+
+    def encrypt(self, message):
+        return self._mix(message, 1)
 
     def decrypt(self, message):
-        decrypted_str = ""
-        for char in message:
-            if char == " ":
-                decrypted_str = decrypted_str + " "
+        return self._mix(message, -1)
+
+    alphabet = property(get_alphabet, set_alphabet)
+    a_joker = property(get_a_joker)
+    b_joker = property(get_b_joker)
+    size = property(get_size)
+
+
+def _default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "solenc")
+
+
+class DeckCache:
+    """
+    An on disk cache of keyed decks, for repeatedly using the same
+    deck and passphrase without re-parsing and re-keying every time.
+
+    Entries are named for a hash of the deck input's contents and a
+    hash of the passphrase, and hold the keyed deck as Deck.to_bytes.
+    Entries are written to a temporary file and renamed into place, so
+    concurrent writers never leave a partial entry behind. Once the
+    entries exceed max_size bytes the least recently used are removed.
+
+    Note that an entry is as sensitive as the deck and passphrase
+    which produced it.
+    """
+
+    def __init__(self, path=None, max_size=1024 * 1024):
+        if path is None:
+            path = _default_cache_dir()
+        self._path = path
+        self._max_size = max_size
+
+    def get_path(self):
+        return self._path
+
+    def get_max_size(self):
+        return self._max_size
+
+    @staticmethod
+    def _digest_deck_input(deck_input):
+        # Hash what lazy_deck_load would read, rather than a filepath
+        if os.path.isfile(deck_input):
+            with open(deck_input, 'rb') as f:
+                return hashlib.sha256(f.read()).digest()
+        return hashlib.sha256(deck_input.encode("utf-8")).digest()
+
+    def entry_path(self, deck_input, passphrase=None):
+        key_digest = hashlib.sha256((passphrase or "").encode("utf-8")).digest()
+        h = hashlib.sha256(
+            self._digest_deck_input(deck_input) + key_digest
+        ).hexdigest()
+        return os.path.join(self._path, h + ".deck")
+
+    def get(self, deck_input, passphrase=None):
+        """
+        Return the cached keyed deck, or None if there isn't one
+        """
+        fp = self.entry_path(deck_input, passphrase)
+        try:
+            with open(fp, 'rb') as f:
+                b = f.read()
+        except OSError:
+            return None
+        try:
+            d = Deck.from_bytes(b, shuffle=False)
+        except ValueError:
+            log.warning("Ignoring corrupt cache entry {}".format(fp))
+            return None
+        try:
+            # Mark the entry as recently used
+            os.utime(fp)
+        except OSError:
+            pass
+        return d
+
+    def put(self, deck_input, passphrase, deck):
+        """
+        Store a keyed deck. Decks which can't be serialized are skipped.
+        """
+        try:
+            b = deck.to_bytes()
+        except ValueError:
+            log.debug("Deck can't be cached")
+            return
+        os.makedirs(self._path, mode=0o700, exist_ok=True)
+        fd, tmp_fp = tempfile.mkstemp(dir=self._path, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b)
+            os.replace(tmp_fp, self.entry_path(deck_input, passphrase))
+        except OSError:
+            try:
+                os.remove(tmp_fp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits max_size
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self._path):
+            if not name.endswith(".deck"):
                 continue
-            keynum = self.gen_keystream(1)[0]
-            ciphertext_charnum = to_number(char)
-            cleartext_charnum = ciphertext_charnum - keynum
-            cleartext_char = to_character(cleartext_charnum)
-            decrypted_str = decrypted_str + cleartext_char
-        return decrypted_str
+            fp = os.path.join(self._path, name)
+            try:
+                st = os.stat(fp)
+            except OSError:  # Removed by someone else
+                continue
+            entries.append((st.st_mtime, st.st_size, fp))
+            total += st.st_size
+        entries.sort()
+        for _, size, fp in entries:
+            if total <= self._max_size:
+                break
+            try:
+                os.remove(fp)
+            except OSError:
+                pass
+            total -= size
 
-    cards = property(get_cards, set_cards, del_cards)
+    path = property(get_path)
+    max_size = property(get_max_size)
 
 
 def lazy_deck_load(some_str):
@@ -433,6 +1342,199 @@ def lazy_value_load(some_str):
     return v
 
 
+# Keystream output formats understood by write_keystream
+keystream_formats = ("raw", "u8", "text")
+
+
+def write_keystream(deck, out, count, fmt="raw", skip=0, chunk_size=65536):
+    """
+    Write count keystream values from a deck to the binary file object out
+
+    Values are generated chunk_size at a time, after discarding the first
+    skip values. Formats:
+
+    - raw: one byte per value, as generated (1-52 for a standard deck)
+    - u8: one decimal value per line
+    - text: one letter per value, A-Z, followed by a newline
+    """
+    if fmt not in keystream_formats:
+        raise ValueError("Unrecognized keystream format!")
+    while skip > 0:
+        n = min(skip, chunk_size)
+        deck.gen_keystream(n)
+        skip -= n
+    while count > 0:
+        n = min(count, chunk_size)
+        keystream = deck.gen_keystream(n)
+        if fmt == "raw":
+            out.write(bytes(keystream))
+        elif fmt == "u8":
+            out.write(("\n".join(map(str, keystream)) + "\n").encode("ascii"))
+        else:
+            out.write(bytes(keystream).translate(_VALUE_LETTERS))
+        count -= n
+    if fmt == "text":
+        out.write(b"\n")
+    out.flush()
+
+
+class MemoryProfile:
+    """
+    The memory used while producing some number of outputs, as
+    measured by tracemalloc: the most in use at once, and what was
+    still held afterwards, by call site. See profile_mem.
+
+    tracemalloc only sees the blocks which are alive when asked, so
+    short lived allocations count towards the peak but can't be
+    broken down by call site.
+    """
+
+    def __init__(self, outputs, peak, stats, unit="output"):
+        self._outputs = outputs
+        self._peak = peak
+        self._stats = stats
+        self._unit = unit
+
+    def get_outputs(self):
+        return self._outputs
+
+    def get_peak(self):
+        """
+        The most memory in use at once, in bytes above the starting point
+        """
+        return self._peak
+
+    def get_stats(self):
+        """
+        tracemalloc.StatisticDiff's of the memory still held afterwards,
+        by call site
+        """
+        return self._stats
+
+    def get_peak_per_output(self):
+        return self._peak / max(self._outputs, 1)
+
+    def get_retained(self):
+        return sum(x.size_diff for x in self._stats)
+
+    def get_retained_blocks(self):
+        return sum(x.count_diff for x in self._stats)
+
+    def to_str(self, limit=10):
+        n = max(self._outputs, 1)
+        lines = [
+            "Memory profile: {} {}s".format(self._outputs, self._unit),
+            "  peak {} B ({:.2f} B per {})".format(
+                self._peak, self._peak / n, self._unit
+            ),
+            "  retained {} B in {} blocks ({:.2f} B, {:.3f} blocks per {})".format(
+                self.get_retained(), self.get_retained_blocks(),
+                self.get_retained() / n, self.get_retained_blocks() / n, self._unit
+            ),
+            "  Retained, by call site:"
+        ]
+        for stat in self._stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append("    {}:{}: {:+d} B in {:+d} blocks ({:.2f} B per {})".format(
+                frame.filename, frame.lineno, stat.size_diff, stat.count_diff,
+                stat.size_diff / n, self._unit
+            ))
+        if not self._stats:
+            lines.append("    (nothing retained)")
+        return "\n".join(lines)
+
+    outputs = property(get_outputs)
+    peak = property(get_peak)
+    stats = property(get_stats)
+
+
+def profile_mem(outputs, func, *args, unit="output", **kwargs):
+    """
+    Call func(*args, **kwargs) under tracemalloc
+
+    Returns the result and a MemoryProfile dividing the peak and
+    retained memory between the given number of outputs.
+    """
+    if not tracemalloc.is_tracing():
+        # Trace only the call itself, so the peak since starting and
+        # everything still traced afterwards are the call's own
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            result = func(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1] - start
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        before = tracemalloc.Snapshot((), after.traceback_limit)
+    else:
+        # Someone else is tracing, so measure relative to where they are
+        if not hasattr(tracemalloc, "reset_peak"):
+            raise RuntimeError(
+                "Profiling while tracemalloc is already tracing needs Python 3.9+"
+            )
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] - start
+        after = tracemalloc.take_snapshot()
+    # Leave out the profiler's own allocations
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    for _, lineno in dis.findlinestarts(profile_mem.__code__):
+        if lineno:
+            ignore.append(tracemalloc.Filter(False, __file__, lineno=lineno))
+    before = before.filter_traces(ignore)
+    after = after.filter_traces(ignore)
+    stats = [x for x in after.compare_to(before, "lineno") if x.size_diff or x.count_diff]
+    return result, MemoryProfile(outputs, peak, stats, unit=unit)
+
+
+def _parse_values(some_str):
+    values = bytearray()
+    for token in some_str.replace(",", "\n").split("\n"):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            values.append(lazy_value_load(token))
+            continue
+        except ValueError:
+            pass
+        words = token.split()
+        if len(words) > 1:
+            # Every word has to be a value, "Ace of Clubs Two of Hearts"
+            # is two cards missing a comma rather than 21 letters
+            values.extend([lazy_value_load(x) for x in words])
+        elif token.isalpha():
+            values.extend(letters_to_values(token))
+        else:
+            raise ValueError("Unrecognized value!")
+    if not values:
+        raise ValueError("Unrecognized value!")
+    return bytes(values)
+
+
+def lazy_values_load(some_str):
+    """
+    Try to load a sequence of "values" any way possible, returning a bytes
+
+    some_str may be the values themselves, or failing that a filepath
+    for a file containing them. Values may look like:
+      - Anything lazy_value_load understands, eg: Ace of Clubs
+      - Values separated by commas or newlines, eg: 1, Ace of Clubs, a
+      - Values separated by spaces, eg: 1 2 3
+      - A run of letters, eg: HELLO
+    """
+    try:
+        return _parse_values(some_str)
+    except ValueError:
+        if not os.path.isfile(some_str):
+            raise
+    with open(some_str) as f:
+        return _parse_values(f.read())
+
+
 def format_str(in_str):
     """
     Format an input string for encryption
@@ -467,6 +1569,200 @@ def format_str(in_str):
     return final_str
 
 
+def _broadcast_encrypt_one(deck, key, values, message):
+    # deck is a deck serialization, or a list of cards
+    if isinstance(deck, str):
+        d = lazy_deck_load(deck)
+    else:
+        d = Deck(cards=deck, shuffle=False)
+    if key:
+        d.key(key)
+    encrypted = add_values(values, bytes(d.gen_keystream(len(values))))
+    return _respace(values_to_letters(encrypted), message)
+
+
+def _broadcast_deck_arg(deck):
+    if isinstance(deck, str):
+        return deck
+    return deck.cards
+
+
+def broadcast_encrypt(message, recipients, workers=None):
+    """
+    Encrypt one message for many recipients
+
+    recipients is an iterable of (name, deck, key) tuples, key being
+    None for an already keyed deck. A deck may also be a deck
+    serialization (see lazy_deck_load), which is then loaded and keyed
+    alongside the keystream, in the pool when there is one. The message
+    is formatted (see format_str) and converted to numbers once, then
+    each recipient only needs their own keystream. The decks themselves
+    aren't changed.
+
+    Yields (name, ciphertext) tuples. With workers, the keystreams are
+    generated in a pool of that many processes and yielded in the order
+    they finish, otherwise they're yielded in order one at a time.
+    """
+    formatted_str = format_str(message)
+    values = letters_to_values(formatted_str.replace(" ", ""))
+    if not workers:
+        for name, deck, key in recipients:
+            yield name, _broadcast_encrypt_one(
+                _broadcast_deck_arg(deck), key, values, formatted_str
+            )
+        return
+    recipients = iter(recipients)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            # Only read ahead of the pool a little, recipients may be many
+            for name, deck, key in islice(recipients, workers * 4 - len(pending)):
+                future = pool.submit(
+                    _broadcast_encrypt_one, _broadcast_deck_arg(deck), key, values,
+                    formatted_str
+                )
+                pending[future] = name
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def _load_keyed_deck(deck_str, key=None, cache=None, tracer=None):
+    """
+    Load a deck and apply a key to it, going through the cache if given one
+
+    A tracer is attached before keying, so the keying is traced
+    unless the keyed deck comes from the cache.
+    """
+    if cache is not None:
+        d = cache.get(deck_str, key)
+        if d is not None:
+            log.info(
+                "Keyed deck state (cached)\n" +
+                "-------------------------\n" +
+                "{}".format(d.to_newline_delimited_str())
+            )
+            d.set_tracer(tracer)
+            return d
+    d = lazy_deck_load(deck_str)
+    d.set_tracer(tracer)
+    log.info(
+        "Initial deck state\n" +
+        "------------------\n" +
+        "{}".format(d.to_newline_delimited_str())
+    )
+    if key:
+        d.key(key)
+        log.info(
+            "Keyed deck state\n" +
+            "------------------\n" +
+            "{}".format(d.to_newline_delimited_str())
+        )
+    if cache is not None:
+        try:
+            cache.put(deck_str, key, d)
+        except OSError as e:
+            log.warning("Couldn't write to the deck cache: {}".format(e))
+    return d
+
+
+def _write_trace(tracer, fp):
+    with open(fp, 'w') as f:
+        tracer.dump(f)
+
+
+def _tracer_from_args(args):
+    """
+    Make a tracer if asked for one, which also writes
+    its worksheet out whenever SIGUSR1 is received
+    """
+    if not args.trace:
+        return None
+    tracer = StepTracer(args.trace_size)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(
+            signal.SIGUSR1, lambda signum, frame: _write_trace(tracer, args.trace)
+        )
+    return tracer
+
+
+def _non_negative_int(some_str):
+    try:
+        n = int(some_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError("must be a whole number")
+    if n < 0:
+        raise argparse.ArgumentTypeError("must not be negative")
+    return n
+
+
+def _positive_int(some_str):
+    n = _non_negative_int(some_str)
+    if n == 0:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return n
+
+
+def _cache_from_args(args):
+    if args.cache:
+        return DeckCache()
+    return None
+
+
+def _maybe_profile_mem(args, outputs, unit, func, *func_args):
+    if not args.profile_mem:
+        return func(*func_args)
+    result, profile = profile_mem(outputs, func, *func_args, unit=unit)
+    stderr.write(profile.to_str() + "\n")
+    return result
+
+
+def _load_terms(parser, n, m):
+    """
+    Load both terms of an add or subtract, repeating a single
+    value to match the length of a sequence
+    """
+    terms = []
+    for term in (n, m):
+        try:
+            terms.append(lazy_values_load(term))
+        except ValueError:
+            parser.error("Unrecognized term {!r}".format(term))
+    n_vals, m_vals = terms
+    if len(n_vals) == 1:
+        n_vals = n_vals * len(m_vals)
+    elif len(m_vals) == 1:
+        m_vals = m_vals * len(n_vals)
+    if len(n_vals) != len(m_vals):
+        parser.error("The terms are sequences of different lengths")
+    return n_vals, m_vals
+
+
+def _load_recipients(fp, default_key=None, cache=None):
+    """
+    Lazily load recipients from a file, one JSON object per line
+    with a "deck", and optionally a "name" and a "key"
+
+    Without a cache the deck serializations and keys are passed along
+    as they are, leaving broadcast_encrypt to load and key them in its
+    pool. With one, keyed decks are looked up (or added) here instead.
+    """
+    with open(fp) as f:
+        for i, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            recipient = loads(line)
+            name = recipient.get("name", str(i))
+            key = recipient.get("key", default_key)
+            if cache is None:
+                yield name, recipient["deck"], key
+                continue
+            yield name, _load_keyed_deck(recipient["deck"], key, cache), None
+
+
 def main():
     parser = argparse.ArgumentParser()
     # Global arguments
@@ -480,13 +1776,43 @@ def main():
     # Encrypt subparser
     encrypt_parser = subparsers.add_parser("encrypt")
     encrypt_parser.add_argument(
-        "-d", "--deck", required=True,
+        "-d", "--deck", default=None,
         help="A deck serialization, or filepath for a file containing one."
     )
     encrypt_parser.add_argument(
         "-k", "--key", default=None,
         help="A key to apply to the initial state of the deck"
     )
+    encrypt_parser.add_argument(
+        "--cache", action='store_true',
+        help="Cache the keyed deck under $XDG_CACHE_HOME/solenc \n" +
+        "to skip parsing and keying it on later runs."
+    )
+    encrypt_parser.add_argument(
+        "--profile-mem", action='store_true',
+        help="Report peak and retained memory per character to stderr"
+    )
+    encrypt_parser.add_argument(
+        "--trace", default=None,
+        help="Write a worksheet of the steps taken to this file \n" +
+        "when finished, or on receiving SIGUSR1"
+    )
+    encrypt_parser.add_argument(
+        "--trace-size", type=_positive_int, default=16384,
+        help="The number of most recent rounds or steps --trace keeps"
+    )
+    encrypt_parser.add_argument(
+        "--recipients", default=None,
+        help="Instead of --deck, a file with one JSON object per line, \n" +
+        "each with a \"deck\", and optionally a \"name\" and a \"key\" \n" +
+        "(defaulting to --key). Outputs a tab separated name and \n" +
+        "ciphertext per recipient, as each is finished. \n" +
+        "Can't be combined with --trace or --profile-mem."
+    )
+    encrypt_parser.add_argument(
+        "--workers", type=_non_negative_int, default=0,
+        help="With --recipients, generate keystreams in this many processes"
+    )
     encrypt_parser.add_argument(
         "message",
         help="The plaintext to encrypt"
@@ -502,11 +1828,71 @@ def main():
         "-k", "--key", default=None,
         help="A key to apply to the initial state of the deck"
     )
+    decrypt_parser.add_argument(
+        "--cache", action='store_true',
+        help="Cache the keyed deck under $XDG_CACHE_HOME/solenc \n" +
+        "to skip parsing and keying it on later runs."
+    )
+    decrypt_parser.add_argument(
+        "--profile-mem", action='store_true',
+        help="Report peak and retained memory per character to stderr"
+    )
+    decrypt_parser.add_argument(
+        "--trace", default=None,
+        help="Write a worksheet of the steps taken to this file \n" +
+        "when finished, or on receiving SIGUSR1"
+    )
+    decrypt_parser.add_argument(
+        "--trace-size", type=_positive_int, default=16384,
+        help="The number of most recent rounds or steps --trace keeps"
+    )
     decrypt_parser.add_argument(
         "message",
         help="The ciphertext to decrypt"
     )
 
+    # Keystream subparser
+    keystream_parser = subparsers.add_parser("keystream")
+    keystream_parser.add_argument(
+        "-d", "--deck", required=True,
+        help="A deck serialization, or filepath for a file containing one."
+    )
+    keystream_parser.add_argument(
+        "-k", "--key", default=None,
+        help="A key to apply to the initial state of the deck"
+    )
+    keystream_parser.add_argument(
+        "-n", "--count", type=_non_negative_int, required=True,
+        help="The number of keystream values to output"
+    )
+    keystream_parser.add_argument(
+        "--format", default="raw", choices=keystream_formats,
+        help="raw: one byte per value, u8: one decimal value \n" +
+        "per line, text: one letter per value"
+    )
+    keystream_parser.add_argument(
+        "--skip", type=_non_negative_int, default=0,
+        help="Discard this many keystream values before output begins"
+    )
+    keystream_parser.add_argument(
+        "--cache", action='store_true',
+        help="Cache the keyed deck under $XDG_CACHE_HOME/solenc \n" +
+        "to skip parsing and keying it on later runs."
+    )
+    keystream_parser.add_argument(
+        "--profile-mem", action='store_true',
+        help="Report peak and retained memory per keystream value to stderr"
+    )
+    keystream_parser.add_argument(
+        "--trace", default=None,
+        help="Write a worksheet of the steps taken to this file \n" +
+        "when finished, or on receiving SIGUSR1"
+    )
+    keystream_parser.add_argument(
+        "--trace-size", type=_positive_int, default=16384,
+        help="The number of most recent rounds or steps --trace keeps"
+    )
+
     # Generate subparser
     generate_parser = subparsers.add_parser("generate")
     generate_parser.add_argument(
@@ -528,54 +1914,84 @@ def main():
 
     # Addition subparser
     addition_parser = subparsers.add_parser("add")
-    addition_parser.add_argument("n", help="The first term")
-    addition_parser.add_argument("m", help="The second term")
+    addition_parser.add_argument(
+        "n", help="The first term, a sequence of terms or a file containing one"
+    )
+    addition_parser.add_argument(
+        "m", help="The second term, a sequence of terms or a file containing one"
+    )
 
     # Subtraction subparser
     subtraction_parser = subparsers.add_parser("subtract")
-    subtraction_parser.add_argument("n", help="The first term")
-    subtraction_parser.add_argument("m", help="The second term")
+    subtraction_parser.add_argument(
+        "n", help="The first term, a sequence of terms or a file containing one"
+    )
+    subtraction_parser.add_argument(
+        "m", help="The second term, a sequence of terms or a file containing one"
+    )
 
     args = parser.parse_args()
 
     logging.basicConfig(level=args.verbosity)
 
     # Encryption functionality
-    if args.subparser_name == "encrypt":
-        d = lazy_deck_load(args.deck)
-        log.info(
-            "Initial deck state\n" +
-            "------------------\n" +
-            "{}".format(d.to_newline_delimited_str())
+    if args.subparser_name == "encrypt" and args.recipients:
+        if args.deck:
+            parser.error("--deck and --recipients can't be used together")
+        if args.trace or args.profile_mem:
+            parser.error("--trace and --profile-mem can't be used with --recipients")
+        recipients = _load_recipients(
+            args.recipients, args.key, _cache_from_args(args)
         )
-        if args.key:
-            d.key(args.key)
-            log.info(
-                "Keyed deck state\n" +
-                "------------------\n" +
-                "{}".format(d.to_newline_delimited_str())
-            )
-
+        for name, encrypted_str in broadcast_encrypt(
+                args.message, recipients, workers=args.workers):
+            stdout.write("{}\t{}\n".format(name, encrypted_str))
+            stdout.flush()
+
+    elif args.subparser_name == "encrypt":
+        if not args.deck:
+            parser.error("One of --deck or --recipients is required")
+        tracer = _tracer_from_args(args)
+        d = _load_keyed_deck(args.deck, args.key, _cache_from_args(args), tracer)
         formatted_str = format_str(args.message)
-        encrypted_str = d.encrypt(formatted_str)
+        encrypted_str = _maybe_profile_mem(
+            args, len(formatted_str) - formatted_str.count(" "), "character",
+            d.encrypt, formatted_str
+        )
         stdout.write(encrypted_str + "\n")
+        if tracer is not None:
+            _write_trace(tracer, args.trace)
 
     # Decryption functionality
     elif args.subparser_name == "decrypt":
-        d = lazy_deck_load(args.deck)
-        log.info(
-            "Initial deck state\n" +
-            "------------------\n" +
-            "{}".format(d.to_newline_delimited_str())
+        tracer = _tracer_from_args(args)
+        d = _load_keyed_deck(args.deck, args.key, _cache_from_args(args), tracer)
+        decrypted_str = _maybe_profile_mem(
+            args, len(args.message) - args.message.count(" "), "character",
+            d.decrypt, args.message
         )
-        if args.key:
-            d.key(args.key)
-            log.info(
-                "Keyed deck state\n" +
-                "------------------\n" +
-                "{}".format(d.to_newline_delimited_str())
+        stdout.write(decrypted_str + "\n")
+        if tracer is not None:
+            _write_trace(tracer, args.trace)
+
+    # Raw keystream output
+    elif args.subparser_name == "keystream":
+        tracer = _tracer_from_args(args)
+        d = _load_keyed_deck(args.deck, args.key, _cache_from_args(args), tracer)
+        try:
+            _maybe_profile_mem(
+                args, args.count, "keystream value",
+                write_keystream, d, stdout.buffer, args.count, args.format, args.skip
             )
-        stdout.write(d.decrypt(args.message) + "\n")
+        except BrokenPipeError:
+            # Whatever we were piped into stopped reading, eg: head.
+            # Point stdout at devnull so flushing it at exit doesn't
+            # raise all over again, and finish quietly.
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, stdout.fileno())
+            return
+        if tracer is not None:
+            _write_trace(tracer, args.trace)
 
     # Deck generator/keyer
     elif args.subparser_name == "generate":
@@ -592,19 +2008,19 @@ def main():
 
     # Addition utility
     elif args.subparser_name == "add":
-        n_val = lazy_value_load(args.n)
-        m_val = lazy_value_load(args.m)
-        stdout.write("{} + {}\n".format(str(n_val), str(m_val)))
-        s = n_val + m_val
-        stdout.write(to_character(s) + "\n")
+        n_vals, m_vals = _load_terms(parser, args.n, args.m)
+        stdout.write("{} + {}\n".format(
+            " ".join(map(str, n_vals)), " ".join(map(str, m_vals))
+        ))
+        stdout.write(values_to_letters(add_values(n_vals, m_vals)) + "\n")
 
     # Subtraction utility
     elif args.subparser_name == "subtract":
-        n_val = lazy_value_load(args.n)
-        m_val = lazy_value_load(args.m)
-        stdout.write("{} - {}\n".format(str(n_val), str(m_val)))
-        s = n_val - m_val
-        stdout.write(to_character(s) + "\n")
+        n_vals, m_vals = _load_terms(parser, args.n, args.m)
+        stdout.write("{} - {}\n".format(
+            " ".join(map(str, n_vals)), " ".join(map(str, m_vals))
+        ))
+        stdout.write(values_to_letters(subtract_values(n_vals, m_vals)) + "\n")
 
     else:
         parser.print_help()
@@ -1,7 +1,14 @@
 import unittest
 import solenc
-from solenc import Deck, format_str
-from tempfile import NamedTemporaryFile
+from solenc import Deck, DeckCache, GeneralizedDeck, format_str, profile_mem, write_keystream
+from solenc import add_values, subtract_values, letters_to_values, values_to_letters
+from solenc import broadcast_encrypt, lazy_values_load, to_character, to_number
+from solenc import StepTracer, TRACE_KEY_ROUND, TRACE_ROUND, TRACE_TRIPLE_CUT
+from io import BytesIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+import argparse
+import os
+import json
 from random import randint, choice
 import string
 
@@ -160,6 +167,290 @@ class Tests(unittest.TestCase):
                 formatted_str
             )
 
+    def test_generalized_matches_standard_deck(self):
+        for key in (None, 'f', 'foo', 'bcd', 'cryptonomicon'):
+            d = Deck(shuffle=False)
+            g = GeneralizedDeck()
+            if key:
+                d.key(key)
+                g.key(key)
+            self.assertEqual(g.gen_keystream(200), d.gen_keystream(200))
+        g = GeneralizedDeck()
+        g.key('cryptonomicon')
+        self.assertEqual(g.encrypt(format_str('SOLITAIRE')), 'KIRAK SFJAN')
+        # Symbols outside the alphabet are X's, just as in Deck
+        d = Deck(shuffle=False)
+        g = GeneralizedDeck()
+        d.key('my key!')
+        g.key('my key!')
+        self.assertEqual(g.gen_keystream(50), d.gen_keystream(50))
+        self.assertEqual(GeneralizedDeck().encrypt('AB!CD'),
+                         Deck(shuffle=False).encrypt('AB!CD'))
+        with self.assertRaises(ValueError):
+            GeneralizedDeck(alphabet='ABC').encrypt('ABD')
+
+    def test_generalized_from_deck(self):
+        d1 = Deck(shuffle=False)
+        d1.key('solitaire')
+        d2 = Deck.from_json_str(d1.to_json_str())
+        g = GeneralizedDeck.from_deck(d1)
+        self.assertEqual(g.gen_keystream(100), d2.gen_keystream(100))
+
+    def test_generalized_bytes(self):
+        alphabet = bytes(range(256))
+        d1 = GeneralizedDeck(size=1000, alphabet=alphabet, shuffle=True)
+        d2 = GeneralizedDeck(size=1000, alphabet=alphabet, cards=d1.to_list())
+        d1.key(b'\x00key\xff')
+        d2.key(b'\x00key\xff')
+        message = bytes(randint(0, 255) for _ in range(500))
+        encrypted = d1.encrypt(message)
+        self.assertEqual(d2.decrypt(encrypted), message)
+        self.assertEqual(sorted(d1.to_list()), list(range(1, 1001)))
+
+    def test_bytes_serialization(self):
+        d1 = Deck(shuffle=False)
+        d1.key('foo')
+        b = d1.to_bytes()
+        self.assertEqual(len(b), len(b"SOLENC\x01") + 54)
+        self.assertEqual(Deck.from_bytes(b, shuffle=False), d1)
+
+    def test_deck_cache(self):
+        with TemporaryDirectory() as tmp:
+            cache = DeckCache(path=os.path.join(tmp, "solenc"))
+            deck_str = Deck(shuffle=False).to_json_str()
+            self.assertIsNone(cache.get(deck_str, 'foo'))
+            d = Deck.from_json_str(deck_str)
+            d.key('foo')
+            cache.put(deck_str, 'foo', d)
+            self.assertEqual(cache.get(deck_str, 'foo'), d)
+            self.assertIsNone(cache.get(deck_str, 'bar'))
+            # The same deck read from a file shares the entry
+            fp = os.path.join(tmp, "deck.json")
+            with open(fp, 'w') as f:
+                f.write(deck_str)
+            self.assertEqual(cache.get(fp, 'foo'), d)
+            # Entries which aren't a whole deck are ignored
+            entry = cache.entry_path(deck_str, 'foo')
+            for corrupt in (b"SOLENC\x01" + bytes([1, 2, 53, 54, 5]),
+                            d.to_bytes()[:-1] + d.to_bytes()[-2:-1]):
+                with open(entry, 'wb') as f:
+                    f.write(corrupt)
+                self.assertIsNone(cache.get(deck_str, 'foo'))
+
+    def test_deck_cache_eviction(self):
+        with TemporaryDirectory() as tmp:
+            entry_size = len(Deck(shuffle=False).to_bytes())
+            cache = DeckCache(path=tmp, max_size=entry_size * 3)
+            deck_str = Deck(shuffle=False).to_json_str()
+            for i in range(5):
+                cache.put(deck_str, str(i), Deck.from_json_str(deck_str))
+                # Make sure the entries' mtimes differ
+                os.utime(cache.entry_path(deck_str, str(i)), (i, i))
+            cache.put(deck_str, 'last', Deck.from_json_str(deck_str))
+            self.assertEqual(len(os.listdir(tmp)), 3)
+            self.assertIsNone(cache.get(deck_str, '0'))
+            self.assertIsNotNone(cache.get(deck_str, 'last'))
+
+    def test_write_keystream(self):
+        expected = [4, 49, 10, 24, 8, 51, 44, 6, 4, 33]
+        for fmt, output in (
+            ("raw", bytes(expected[3:])),
+            ("u8", "".join("{}\n".format(x) for x in expected[3:]).encode("ascii")),
+            ("text", b"XHYRFDG\n")
+        ):
+            out = BytesIO()
+            write_keystream(Deck(shuffle=False), out, 7, fmt=fmt, skip=3, chunk_size=2)
+            self.assertEqual(out.getvalue(), output)
+
+    def test_keystream_allocation_budget(self):
+        d = Deck(shuffle=False)
+        d.key('cryptonomicon')
+
+        def rounds(n):
+            for _ in range(n):
+                d.gen_keystream(1)
+
+        # Nothing but the one value list should be alive at once
+        _, profile = profile_mem(2000, rounds, 2000)
+        self.assertLess(profile.peak, 512)
+        self.assertEqual(profile.get_retained_blocks(), 0)
+        self.assertTrue(profile.to_str().endswith(
+            "  Retained, by call site:\n    (nothing retained)"
+        ))
+        # The returned list is all that's allocated per value
+        keystream, profile = profile_mem(5000, d.gen_keystream, 5000)
+        self.assertLessEqual(profile.get_peak_per_output(), 10)
+        self.assertLessEqual(profile.get_retained_blocks(), 1)
+
+    def test_encrypt_allocation_budget(self):
+        message = format_str(''.join(choice(string.ascii_letters) for _ in range(5000)))
+        for f in (Deck(shuffle=False).encrypt, Deck(shuffle=False).decrypt):
+            _, profile = profile_mem(5000, f, message)
+            self.assertLessEqual(profile.get_peak_per_output(), 32)
+            self.assertLessEqual(profile.get_retained_blocks(), 1)
+
+    def test_batch_mixing(self):
+        a = [randint(0, 127) for _ in range(1000)]
+        b = [randint(0, 127) for _ in range(1000)]
+        self.assertEqual(
+            add_values(a, b),
+            bytes(to_number(to_character(x + y)) for x, y in zip(a, b))
+        )
+        self.assertEqual(
+            subtract_values(bytes(a), bytes(b)),
+            bytes(to_number(to_character(x - y)) for x, y in zip(a, b))
+        )
+        text = "Hello, World!"
+        self.assertEqual(letters_to_values(text), bytes(to_number(c) for c in text))
+        self.assertEqual(values_to_letters(a), ''.join(to_character(x) for x in a))
+        with self.assertRaises(ValueError):
+            add_values([1, 2], [1])
+
+    def test_batch_mixing_pure_python(self):
+        np = solenc._np
+        solenc._np = None
+        try:
+            self.test_batch_mixing()
+            with self.assertRaises(ValueError):
+                add_values([128], [1])
+        finally:
+            solenc._np = np
+
+    @unittest.skipUnless(solenc._np is not None, "NumPy is not installed")
+    def test_batch_mixing_numpy(self):
+        np = solenc._np
+        self.test_batch_mixing()
+        a = np.array([randint(0, 127) for _ in range(1000)])
+        b = np.array([randint(0, 127) for _ in range(1000)])
+        self.assertEqual(add_values(a, b), add_values(a.tolist(), b.tolist()))
+        for bad in ([128], [-1], np.array([128]), np.array([257]), np.array([-1])):
+            with self.assertRaises(ValueError):
+                add_values(bad, [1])
+            with self.assertRaises(ValueError):
+                subtract_values([1], bad)
+
+    def test_lazy_values_load(self):
+        self.assertEqual(lazy_values_load("Ace of Clubs"), bytes([1]))
+        self.assertEqual(lazy_values_load("1, Ace of Spades, c"), bytes([1, 14, 3]))
+        self.assertEqual(lazy_values_load("1 2 30"), bytes([1, 2, 4]))
+        self.assertEqual(lazy_values_load("ABC, DE"), bytes([1, 2, 3, 4, 5]))
+        for bad in ("Ace of Clubs Two of Hearts", "ABC DE", "1 2 X!", ""):
+            with self.assertRaises(ValueError):
+                lazy_values_load(bad)
+        target_file = NamedTemporaryFile(mode='w')
+        target_file.write("HELLO\nWorld\n")
+        target_file.flush()
+        self.assertEqual(lazy_values_load(target_file.name), letters_to_values("HELLOWORLD"))
+        # Values are never mistaken for files that happen to share their names
+        cwd = os.getcwd()
+        with TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                for name in ("1", "a"):
+                    with open(name, 'w') as f:
+                        f.write("HELLO\n")
+                    self.assertEqual(lazy_values_load(name), bytes([1]))
+            finally:
+                os.chdir(cwd)
+
+    def test_broadcast_encrypt(self):
+        message = "Meet me at the usual place!"
+        keys = ['foo', 'bar', None, 'cryptonomicon']
+        expected = {}
+        for i, key in enumerate(keys):
+            d = Deck(shuffle=False)
+            if key:
+                d.key(key)
+            expected[str(i)] = d.encrypt(format_str(message))
+        for workers in (None, 2):
+            recipients = [(str(i), Deck(shuffle=False), key) for i, key in enumerate(keys)]
+            self.assertEqual(
+                dict(broadcast_encrypt(message, recipients, workers=workers)),
+                expected
+            )
+            # The decks are left as they were
+            for _, d, _ in recipients:
+                self.assertEqual(d, Deck(shuffle=False))
+
+    def test_broadcast_encrypt_recipients_file(self):
+        message = "Meet me at the usual place!"
+        deck_str = Deck(shuffle=False).to_json_str()
+        expected = {}
+        with TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, "recipients")
+            with open(fp, 'w') as f:
+                f.write(json.dumps({'name': 'alice', 'deck': deck_str, 'key': 'foo'}) + "\n")
+                f.write(json.dumps({'name': 'bob', 'deck': deck_str}) + "\n")
+            for name, key in (('alice', 'foo'), ('bob', 'bar')):
+                d = Deck(shuffle=False)
+                d.key(key)
+                expected[name] = d.encrypt(format_str(message))
+            # Without a cache the unkeyed decks and keys go to the workers
+            self.assertEqual(
+                list(solenc._load_recipients(fp, 'bar')),
+                [('alice', deck_str, 'foo'), ('bob', deck_str, 'bar')]
+            )
+            for workers in (None, 2):
+                self.assertEqual(
+                    dict(broadcast_encrypt(
+                        message, solenc._load_recipients(fp, 'bar'), workers=workers
+                    )),
+                    expected
+                )
+            # With one they're keyed up front
+            cache = DeckCache(path=os.path.join(tmp, "cache"))
+            recipients = list(solenc._load_recipients(fp, 'bar', cache))
+            self.assertTrue(all(key is None for _, _, key in recipients))
+            self.assertEqual(dict(broadcast_encrypt(message, recipients)), expected)
+
+    def test_step_tracer(self):
+        d1 = Deck(shuffle=False)
+        d2 = Deck(shuffle=False)
+        tracer = StepTracer(capacity=4)
+        d1.set_tracer(tracer)
+        d1.key('cryptonomicon')
+        d2.key('cryptonomicon')
+        self.assertEqual(d1.encrypt('SOLIT AIREX'), 'KIRAK SFJAN')
+        self.assertEqual(d1.gen_keystream(20), d2.gen_keystream(30)[10:])
+        # Only the last four rounds are kept
+        self.assertEqual(tracer.count, 13 + 10 + 20)
+        self.assertEqual(len(tracer.records), 4)
+        self.assertTrue(all(r[0] == TRACE_ROUND for r in tracer.records))
+        d1.triple_cut()
+        self.assertEqual(tracer.records[-1][0], TRACE_TRIPLE_CUT)
+        worksheet = tracer.to_worksheet()
+        self.assertTrue(worksheet.startswith("(40 earlier steps not kept)\nStep 41: "))
+        self.assertIn("Step 44: Triple cut around the Jokers at positions", worksheet)
+
+    def test_count_argument_types(self):
+        self.assertEqual(solenc._non_negative_int("0"), 0)
+        self.assertEqual(solenc._positive_int("16"), 16)
+        for f, bad in ((solenc._non_negative_int, "-1"), (solenc._positive_int, "0"),
+                       (solenc._positive_int, "-3"), (solenc._positive_int, "x")):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                f(bad)
+
+    def test_step_tracer_worksheet(self):
+        d = Deck(shuffle=False)
+        tracer = StepTracer()
+        d.set_tracer(tracer)
+        d.key('a')
+        self.assertEqual(d.gen_keystream(1), [49])
+        self.assertEqual([r[0] for r in tracer.records], [TRACE_KEY_ROUND, TRACE_ROUND])
+        self.assertEqual(tracer.to_worksheet().split("\n")[:8], [
+            "Step 1: Keying round",
+            "  - Move Joker (A) down from position 53 to 54",
+            "  - Move Joker (B) down from position 53 to 54",
+            "  - Move Joker (B) down from position 54 to 2",
+            "  - Triple cut around the Jokers at positions 2 and 54",
+            "  - Count cut 1 card",
+            "  - Count cut 1 card for the key",
+            "Step 2: Keystream round"
+        ])
+        # Tracing doesn't allocate per round
+        _, profile = profile_mem(1000, d.gen_keystream, 1000)
+        self.assertLessEqual(profile.get_peak_per_output(), 10)
+
 
 if __name__ == "__main__":
     unittest.main()